@@ -1,11 +1,42 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
+import aiohttp
+import asyncio
 import trafilatura
 import yfinance as yf
+import pandas as pd
+import numpy as np
 from ddgs import DDGS
 import os
+import io
+import re
+import pathlib
 import time
-from urllib.parse import urlparse
+import orjson
+import hashlib
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from itertools import zip_longest
+from urllib.parse import urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
+
+try:
+    import uvloop
+    _new_event_loop = uvloop.new_event_loop
+except ImportError:  # uvloop has no Windows build
+    _new_event_loop = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # optional fast path; trafilatura handles every page
+    LexborHTMLParser = None
 
 # ---------------- CONFIG ----------------
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -30,80 +61,545 @@ BLOCKED_DOMAINS = (
     "ft.com",
 )
 
+# Sites that usually serve clean, extractable article text; unknown = 0
+DOMAIN_QUALITY = {
+    "reuters.com": 5,
+    "apnews.com": 5,
+    "cnbc.com": 4,
+    "marketwatch.com": 4,
+    "yahoo.com": 3,
+    "nasdaq.com": 3,
+    "fool.com": 3,
+    "forbes.com": 2,
+    "businessinsider.com": 2,
+}
+
+# Matches a blocked domain (or any subdomain of one) in the URL's host
+# part, so "ft.com" no longer catches "microsoft.com"
+_BLOCKED_RE = re.compile(
+    r"^[a-z][a-z0-9+.-]*://(?:[^/?#@]*@)?(?:[^/?#:]*\.)?"
+    r"(?:" + "|".join(re.escape(d) for d in BLOCKED_DOMAINS) + r")"
+    r"(?::\d+)?(?:[/?#]|$)",
+    re.IGNORECASE
+)
+
+ARTICLE_TTL = 3600  # seconds an extracted article is reused across runs
+ARTICLE_DISK_TTL = 7 * 86400  # seconds it is kept on disk across restarts
+ARTICLE_CACHE_DIR = pathlib.Path(".article_cache")
+COMPLETION_TTL = 1800  # seconds a finished Groq analysis is reused
+GROQ_MAX_RETRY_WAIT = 10  # longer Retry-After waits fail instead of stalling
+NEWS_CHAR_BUDGET = 3500  # chars of combined article text sent to Groq
+MAX_HTML_BYTES = 2_000_000  # larger pages are skipped or cut off here
+HTML_TYPES = {"text/html", "application/xhtml+xml"}
+EXTRACT_TIMEOUT = 15  # seconds before an extraction worker counts as stuck
+
+NEWS_SUMMARY_CHARS = 1500  # news is cut down to its key sentences first
+
+ANALYZE_SYSTEM_PROMPT = """Stock analyst. Input: ticker, price, news.
+1. Sentiment: Positive/Negative/Neutral
+2. News justifies price? yes/no + why
+3. Action: max 3 lines
+Plain text."""
+
 # ---------------- HELPERS ----------------
+@st.cache_resource
+def _ddgs():
+    # DDGS keeps its search engine clients on the instance, so one shared
+    # object reuses their cookies and connections across searches
+    return DDGS()
+
+
+def normalize_url(url):
+    # The same story shared with different tracking tags, fragment or
+    # trailing slash should only be crawled once
+    parts = urlsplit(url)
+    query = urlencode([
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_")
+    ])
+    return urlunsplit((parts.scheme, parts.netloc, parts.path.rstrip("/") or "/", query, ""))
+
+
+def _ddg_news(ddgs, query, max_results):
+    return [r.get("url") for r in ddgs.news(query, max_results=max_results)]
+
+
+def _yahoo_news(ticker, max_results):
+    # Prefer the publisher's own page over Yahoo's copy when both are listed
+    urls = []
+    for item in yf.Ticker(ticker).get_news(count=max_results):
+        content = item.get("content") or {}
+        link = content.get("clickThroughUrl") or content.get("canonicalUrl") or {}
+        urls.append(link.get("url"))
+    return urls
+
+
+@st.cache_data(ttl=600, show_spinner=False)
 def search_news(query, max_results=40):
-    links = []
-    with DDGS() as ddgs:
-        for r in ddgs.news(query, max_results=max_results):
-            url = r.get("url")
-            if url and url not in links:
-                links.append(url)
-    return links
+    ddgs = _ddgs()
+
+    # Both sources are blocking clients, so each gets a thread and the
+    # search takes as long as the slower one rather than their sum
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [
+            pool.submit(_ddg_news, ddgs, query, max_results),
+            pool.submit(_yahoo_news, query, 20),
+        ]
+    ok = [f.result() for f in futures if f.exception() is None]
+    if not ok:
+        # Raise rather than return [] so an outage isn't cached as "no news"
+        raise futures[0].exception()
+
+    # Interleave so each source's top hits come first, then dedupe in one
+    # pass while keeping that order. The first original URL is what gets
+    # crawled: sites whose canonical URLs end in "/" redirect the stripped
+    # form, which would cost a round trip per article
+    first = {}
+    for rank in zip_longest(*ok):
+        for url in rank:
+            if url:
+                first.setdefault(normalize_url(url), url)
+    return list(first.values())
 
 
 def is_blocked_domain(url):
-    domain = urlparse(url).netloc.lower()
-    return any(bad in domain for bad in BLOCKED_DOMAINS)
+    return bool(_BLOCKED_RE.search(url))
+
+
+_SECOND_LEVEL = {"co", "com", "net", "org", "gov", "ac", "edu"}
+
+
+def site_of(url):
+    # Registrable-ish domain: finance.yahoo.com and uk.yahoo.com -> yahoo.com.
+    # Country suffixes like co.uk and com.au keep one more label, so that
+    # bbc.co.uk and independent.co.uk don't count as the same site
+    labels = (urlparse(url).hostname or "").split(".")
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def rank_links(urls):
+    # Best-known sites first (sort is stable, so DDG's order breaks ties),
+    # then round-robin across sites so one outlet can't take every slot
+    by_site = {}
+    for url in urls:
+        by_site.setdefault(site_of(url), []).append(url)
+
+    queues = sorted(
+        by_site.values(),
+        key=lambda q: -DOMAIN_QUALITY.get(site_of(q[0]), 0)
+    )
+
+    ordered = []
+    while queues:
+        ordered.extend(q.pop(0) for q in queues)
+        queues = [q for q in queues if q]
+    return ordered
+
+
+@st.cache_resource
+def _article_cache():
+    # url -> (fetched_at, text); shared by every session in this process
+    return {}
+
+
+def drop_expired(cache, ttl):
+    # Process-wide caches only ever gain keys, so inserts also clear out
+    # entries older than the TTL. Entries are (stored_at, ...) tuples
+    cutoff = time.time() - ttl
+    for key, entry in list(cache.items()):
+        if entry[0] < cutoff:
+            cache.pop(key, None)
+
+
+def _article_path(url):
+    digest = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+    return ARTICLE_CACHE_DIR / f"{digest}.json"
 
 
-def crawl_article(url):
+def read_saved_article(url):
+    # Published articles rarely change, so the extracted text outlives both
+    # ARTICLE_TTL and the server process
+    path = _article_path(url)
+    try:
+        saved = orjson.loads(path.read_bytes())
+        if time.time() - saved["ts"] < ARTICLE_DISK_TTL:
+            return saved["text"]
+        # Expired: remove it so the directory doesn't only ever grow
+        path.unlink(missing_ok=True)
+    except Exception:
+        pass  # missing or unreadable: fetch it again
+    return None
+
+
+def sweep_saved_articles():
+    # Reads only clear out files for URLs that come up again, so about once
+    # a day every file is checked against its write time as well
+    marker = ARTICLE_CACHE_DIR / ".swept"
+    now = time.time()
+    if marker.exists() and now - marker.stat().st_mtime < 86400:
+        return
+    marker.touch()
+    for path in ARTICLE_CACHE_DIR.glob("*.json"):
+        if now - path.stat().st_mtime >= ARTICLE_DISK_TTL:
+            path.unlink(missing_ok=True)
+
+
+def save_article(url, text):
+    try:
+        ARTICLE_CACHE_DIR.mkdir(exist_ok=True)
+        path = _article_path(url)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(orjson.dumps({"ts": time.time(), "text": text}))
+        # Atomic rename: a concurrent reader sees the old file or the new one
+        os.replace(tmp, path)
+        sweep_saved_articles()
+    except Exception:
+        pass  # the article is already in memory; it just won't survive a restart
+
+
+@st.cache_resource
+def _extract_pool():
+    # Forked, not spawned: Streamlit installs this script as __main__, and
+    # spawn/forkserver workers would re-import it and run the whole app.
+    # Workers are forked once, when the pool first fills, and then reused.
+    # The server is multi-threaded (Tornado, script runs, prefetch and
+    # warm-up threads), so a child can be forked while another thread holds
+    # a lock and deadlock on it (Python 3.12+ warns about this). Workers
+    # only ever run trafilatura, and the pool is probed here, on the script
+    # thread before a crawl starts, so a pool that never comes up falls back
+    # to threads. It is only replaced once a worker dies (BrokenProcessPool).
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None, None  # e.g. Windows: use asyncio's default thread pool
+
+    workers = min(4, os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("fork")
+    )
+    try:
+        pool.submit(os.getpid).result(timeout=EXTRACT_TIMEOUT)
+    except Exception:
+        pool.shutdown(wait=False, cancel_futures=True)
+        return None, None  # workers didn't come up: threads are slower but safe
+    # One slot per worker: jobs wait for a slot rather than in the pool's
+    # own queue, so a job's timeout only covers its own run
+    return pool, threading.BoundedSemaphore(workers)
+
+
+def quick_extract(html, charset=None):
+    # Pages that mark up their body (schema.org articleBody or <article>)
+    # can be read straight off lexbor's DOM in a few ms, well under
+    # trafilatura's heuristics; None means "leave it to trafilatura"
+    if LexborHTMLParser is None:
+        return None
+
+    # The header charset wins; without one lexbor reads <meta charset>
+    if charset:
+        try:
+            html = html.decode(charset)
+        except (UnicodeDecodeError, LookupError):
+            return None
+    tree = LexborHTMLParser(html, encoding=not charset)
+    node = tree.css_first("[itemprop='articleBody']") or tree.css_first("article")
+    if node is None:
+        return None
+
+    node.strip_tags(["nav", "aside", "figure", "form", "footer"])
+    paragraphs = (" ".join(p.text().split()) for p in node.css("p"))
+    text = "\n".join(p for p in paragraphs if p)
+
+    # Replacement characters mean the charset was still guessed wrong;
+    # trafilatura does its own detection on the raw bytes
+    if "\ufffd" in text or len(text) <= 300:
+        return None
+    return text
+
+
+async def crawl_article(session, url, extractor):
+    cache = _article_cache()
+    hit = cache.get(url)
+    if hit and time.time() - hit[0] < ARTICLE_TTL:
+        return hit[1]
+
+    saved = read_saved_article(url)
+    if saved:
+        drop_expired(cache, ARTICLE_TTL)
+        cache[url] = (time.time(), saved)
+        return saved
+
     try:
         if is_blocked_domain(url):
             return None
 
-        resp = requests.get(
+        async with session.get(
             url,
-            headers=HEADERS,
-            timeout=20
-        )
-
-        if resp.status_code != 200 or len(resp.text) < 2000:
+            timeout=aiohttp.ClientTimeout(total=20)
+        ) as resp:
+            if resp.status != 200:
+                return None
+
+            # Judge the page by its headers before pulling the body
+            # A missing Content-Type is given the benefit of the doubt
+            if "Content-Type" in resp.headers and resp.content_type not in HTML_TYPES:
+                return None
+            size = resp.content_length
+            if size is not None and size > MAX_HTML_BYTES:
+                return None
+            if size is not None and size < 2000 and not resp.headers.get("Content-Encoding"):
+                return None
+
+            # Raw bytes, capped: rejected pages are never decoded, and
+            # trafilatura does its own charset detection on the rest
+            chunks = []
+            total = 0
+            async for chunk in resp.content.iter_chunked(65536):
+                chunks.append(chunk)
+                total += len(chunk)
+                if total >= MAX_HTML_BYTES:
+                    break
+            html = b"".join(chunks)
+            charset = resp.charset
+
+        if len(html) < 2000:
             return None
 
-        text = trafilatura.extract(
-            resp.text,
-            include_comments=False,
-            include_tables=False
-        )
+        # The lexbor fast path is cheap enough to run inline. Full
+        # extraction is CPU-bound and holds the GIL, so it runs in worker
+        # processes; only the HTML bytes cross the process boundary
+        text = quick_extract(html, charset)
+        if text is None:
+            text = await extract_in_pool(extractor, partial(
+                trafilatura.extract,
+                html,
+                include_comments=False,
+                include_tables=False,
+                fast=True
+            ))
 
         if text and len(text.strip()) > 300:
-            return text.strip()
+            text = text.strip()
+            drop_expired(cache, ARTICLE_TTL)
+            cache[url] = (time.time(), text)
+            save_article(url, text)
+            return text
 
         return None
 
+    except BrokenProcessPool:
+        # A crashed worker poisons the pool; build a fresh one next time
+        _extract_pool.clear()
+        return None
+
     except Exception:
         return None
 
 
+async def extract_in_pool(extractor, job):
+    pool, slots = extractor
+    if pool is None:
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(None, job), EXTRACT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+
+    # Slots are shared with other sessions' crawls, so poll instead of
+    # blocking the loop; the clock only starts once a worker is free
+    while not slots.acquire(blocking=False):
+        await asyncio.sleep(0.05)
+    try:
+        work = pool.submit(job)
+    except BaseException:
+        slots.release()
+        raise
+    # Freed when the job actually ends, so a stuck job keeps its slot
+    work.add_done_callback(lambda _: slots.release())
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(work), EXTRACT_TIMEOUT)
+    except asyncio.TimeoutError:
+        # Give up on this page; the worker is left to finish and is reused
+        return None
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            work.cancel()  # the crawl is over: drop the job if it hasn't started
+            raise
+        return None  # the executor cancelled the job: just a failed source
+
+
+def run_async(coro):
+    # A private loop per call (uvloop where available) so Streamlit's own
+    # server loop and the global event loop policy are left untouched
+    with asyncio.Runner(loop_factory=_new_event_loop) as runner:
+        return runner.run(coro)
+
+
+async def crawl_all(urls, extractor, limit=5, on_result=None):
+    connector = aiohttp.TCPConnector(limit=20, limit_per_host=2)
+    articles = []
+
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector) as session:
+        tasks = [asyncio.create_task(crawl_article(session, u, extractor)) for u in urls]
+        try:
+            for attempted, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+                text = await next_done
+                if text:
+                    articles.append(text)
+                if on_result:
+                    on_result(attempted, text, articles)
+                if len(articles) >= limit:
+                    break
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return articles
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _last_close(ticker):
+    # Raises rather than returning None so a Yahoo blip isn't cached as
+    # "no price" for the next minute
+    data = yf.Ticker(ticker).history(period="1d")
+    if data.empty:
+        raise LookupError(f"No price data for {ticker}")
+    return round(float(data["Close"].iloc[-1]), 2)
+
+
 def get_stock_price(ticker):
     try:
-        stock = yf.Ticker(ticker)
-        data = stock.history(period="1d")
-        if data.empty:
-            return None
-        return round(float(data["Close"].iloc[-1]), 2)
+        return _last_close(ticker)
     except Exception:
         return None
 
 
-def analyze_with_groq(news_text, price, ticker):
-    prompt = f"""
-You are a financial analyst.
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def join_news(articles, budget=NEWS_CHAR_BUDGET):
+    # "\n\n".join(articles) cut to the budget, backed off to the last
+    # sentence end that fits, without first building the full string when
+    # the articles run to tens of KB each
+    buf = io.StringIO()
+    remaining = budget
+    for i, text in enumerate(articles):
+        for piece in (("\n\n" if i else ""), text):
+            if len(piece) > remaining:
+                # Cut at the last sentence that fits rather than mid-word
+                piece = piece[:remaining]
+                ends = [m.start() for m in _SENTENCE_RE.finditer(piece)]
+                if ends:
+                    piece = piece[:ends[-1]]
+                buf.write(piece)
+                return buf.getvalue()
+            buf.write(piece)
+            remaining -= len(piece)
+    return buf.getvalue()
+
+
+def news_filled(articles, budget=NEWS_CHAR_BUDGET):
+    # True once the articles reach the budget, so further ones can no longer
+    # change what join_news returns
+    return sum(map(len, articles)) + 2 * (len(articles) - 1) >= budget
+
+
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9'$%.-]*[a-z0-9%]|[a-z0-9]")
+
+
+def summarize_news(text, budget=NEWS_SUMMARY_CHARS):
+    # Extractive TF-IDF over sentences: a sentence scores by the IDF of its
+    # distinct words averaged over its length, so dense lines win and long
+    # ones can't win on word count alone (or by repeating "our" and "the").
+    # The best sentences that fit the budget are kept in reading order.
+    if len(text) <= budget:
+        return text
+
+    # Syndicated copies repeat whole sentences; each is only worth sending once
+    sentences = list(dict.fromkeys(s.strip() for s in _SENTENCE_RE.split(text)))
+    sentences = [s for s in sentences if s]
+    words = [_WORD_RE.findall(s.lower()) for s in sentences]
+
+    df = {}
+    for ws in words:
+        for w in set(ws):
+            df[w] = df.get(w, 0) + 1
+    n = len(sentences)
+    idf = {w: np.log(n / c) for w, c in df.items()}
+
+    scores = [sum(idf[w] for w in set(ws)) / (len(ws) or 1) for ws in words]
+    ranked = sorted(range(n), key=scores.__getitem__, reverse=True)
+    keep = []
+    used = 0
+    for i in ranked:
+        cost = len(sentences[i]) + 1
+        if used + cost <= budget:
+            keep.append(i)
+            used += cost
+
+    if not keep:
+        # Every sentence is longer than the budget (long run-ons, or text
+        # with no sentence punctuation): cut the best one rather than send
+        # Groq no news at all
+        return sentences[ranked[0]][:budget]
+    return " ".join(sentences[i] for i in sorted(keep))
+
+
+class _GroqRetry(Retry):
+    # urllib3 sleeps out the whole Retry-After. Short per-minute limits are
+    # worth waiting for, but quota 429s ask for minutes while the page shows
+    # an empty "AI Evaluation" block, so those give up and surface the 429
+    def increment(self, method=None, url=None, response=None, *args, **kwargs):
+        if response is not None:
+            wait = self.get_retry_after(response)
+            if wait is not None and wait > GROQ_MAX_RETRY_WAIT:
+                raise MaxRetryError(kwargs.get("_pool"), url, "Retry-After too long")
+        return super().increment(method, url, response, *args, **kwargs)
+
+
+@st.cache_resource(show_spinner=False)
+def _groq_session():
+    # One per server process rather than per rerun, so Groq calls ride a
+    # warm keep-alive connection instead of paying a fresh TLS handshake
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=_GroqRetry(
+            total=3,
+            backoff_factor=0.3,
+            # 429 waits out a short Retry-After before trying again
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False
+        )
+    ))
+    if GROQ_API_KEY:
+        # Open that connection now, off the script thread, so the first
+        # analysis doesn't wait on DNS and the handshake either
+        threading.Thread(target=_warm_up, args=(session,), daemon=True).start()
+    return session
 
-Stock: {ticker}
-Current Price: {price}
 
-News Articles:
-{news_text[:3500]}
+def _warm_up(session):
+    try:
+        session.head(GROQ_ENDPOINT, timeout=3)
+    except requests.RequestException:
+        pass
+
+
+class GroqResponseError(Exception):
+    pass
+
 
-Tasks:
-1. Sentiment (Positive / Negative / Neutral)
-2. Does news justify the price?
-3. Actionable insight (max 3 lines)
+@st.cache_resource
+def _completion_cache():
+    # prompt digest -> (finished_at, text)
+    return {}
 
-Respond in plain text.
-"""
 
+def _groq_stream(messages):
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json"
@@ -111,110 +607,212 @@ Respond in plain text.
 
     payload = {
         "model": GROQ_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.2
+        "messages": messages,
+        # Greedy decoding: the same prompt gives the same analysis, which is
+        # what the completion cache assumes when it replays one
+        "temperature": 0,
+        "stream": True
     }
 
-    try:
-        response = requests.post(
-            GROQ_ENDPOINT,
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-
-        data = response.json()
+    with _groq_session().post(
+        GROQ_ENDPOINT,
+        headers=headers,
+        data=orjson.dumps(payload),
+        timeout=30,
+        stream=True
+    ) as response:
 
         # ---- HARD SAFETY CHECK ----
-        if "choices" not in data:
-            return (
+        if response.status_code != 200:
+            raise GroqResponseError(
                 "Groq API did not return a valid completion.\n\n"
-                f"Response:\n{data}"
+                f"Response:\n{response.text}"
             )
 
-        return data["choices"][0]["message"]["content"]
+        # Server-sent events: one "data: {json}" line per token batch
+        for line in response.iter_lines():
+            if not line.startswith(b"data:"):
+                continue
+
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                return
+
+            for choice in orjson.loads(data).get("choices", []):
+                content = choice.get("delta", {}).get("content")
+                if content:
+                    yield content
+
+    raise GroqResponseError("Groq stream ended before the completion finished.")
+
+
+def analyze_with_groq(news_text, price, ticker):
+    news_text = summarize_news(news_text)
+
+    # Static rubric goes first as the system turn so every request shares
+    # the same prefix; only the short user turn varies per call
+    messages = [
+        {"role": "system", "content": ANALYZE_SYSTEM_PROMPT},
+        {"role": "user", "content": (
+            f"Ticker: {ticker}\n"
+            f"Price: {price}\n"
+            f"News:\n{news_text}"
+        )},
+    ]
+
+    # Keyed on the price to 0.1 so a few cents of drift between clicks
+    # still reuses the analysis of the same news. Crawls finish in a
+    # different order each run, so the news is keyed as a set of sentences:
+    # the same articles shuffled still hit, but one article swapped out is a
+    # miss, since it can be the one that flips the verdict
+    sentences = sorted({s.strip() for s in _SENTENCE_RE.split(news_text)} - {""})
+    key = f"{ticker}|{price:.1f}|" + "\n".join(sentences)
+    prompt_hash = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    cache = _completion_cache()
+    now = time.time()
+    hit = cache.get(prompt_hash)
+    if hit and now - hit[0] < COMPLETION_TTL:
+        yield hit[1]
+        return
+
+    try:
+        chunks = []
+        for token in _groq_stream(messages):
+            chunks.append(token)
+            yield token
+
+        # Only complete streams are reused; errors are retried next time
+        drop_expired(cache, COMPLETION_TTL)
+        cache[prompt_hash] = (time.time(), "".join(chunks))
+
+    except GroqResponseError as e:
+        yield str(e)
 
     except Exception as e:
-        return f"Groq API call failed: {str(e)}"
+        yield f"Groq API call failed: {str(e)}"
+
+
+def prefetch(tokens):
+    # Start draining a token generator on a worker thread right away; the
+    # returned generator replays whatever has arrived, then follows live
+    q = queue.Queue()
+
+    def pump():
+        try:
+            for token in tokens:
+                q.put(token)
+        finally:
+            q.put(None)
+
+    worker = threading.Thread(target=pump, daemon=True)
+    add_script_run_ctx(worker, get_script_run_ctx())
+    worker.start()
+
+    def replay():
+        while (token := q.get()) is not None:
+            yield token
+
+    return replay()
 
 
 
 # ---------------- STREAMLIT UI ----------------
 st.set_page_config(page_title="News vs Stock Analyzer", layout="wide")
+_groq_session()
 
 st.title("News vs Stock Price Analyzer")
 st.caption("Adaptive crawling • Free stack • Real-world safe")
 
-ticker = st.text_input(
-    "Enter Stock Ticker (e.g. AAPL, TSLA, INFY)",
-    placeholder="AAPL"
-)
+# Widgets inside the fragment only rerun the fragment, so typing a ticker
+# or pressing Analyze doesn't rebuild the dashboard charts below
+@st.fragment
+def analyzer():
+    ticker = st.text_input(
+        "Enter Stock Ticker (e.g. AAPL, TSLA, INFY)",
+        placeholder="AAPL"
+    )
 
+    if st.button("Analyze") and ticker:
+        ticker = ticker.strip().upper()
 
-if st.button("Analyze") and ticker:
-    ticker = ticker.strip().upper()
+        # Price and news search are independent: start both now and wait on
+        # each only where its result is needed
+        lookups = ThreadPoolExecutor(
+            max_workers=2,
+            initializer=add_script_run_ctx,
+            initargs=(None, get_script_run_ctx())
+        )
+        price_future = lookups.submit(get_stock_price, ticker)
+        links_future = lookups.submit(search_news, ticker)
+        lookups.shutdown(wait=False)
+
+        # ---- PRICE ----
+        with st.spinner("Fetching live stock price..."):
+            price = price_future.result()
 
-    # ---- PRICE ----
-    with st.spinner("Fetching live stock price..."):
-        price = get_stock_price(ticker)
+        if not price:
+            st.error("Could not fetch stock price. Check ticker.")
+            return
 
-    if not price:
-        st.error("Could not fetch stock price. Check ticker.")
-        st.stop()
+        st.success(f"Current Price: {price}")
 
-    st.success(f"Current Price: {price}")
+        # ---- SEARCH ----
+        with st.spinner("Searching news sources..."):
+            links = links_future.result()
 
-    # ---- SEARCH ----
-    with st.spinner("Searching news sources..."):
-        links = search_news(ticker)
+        if not links:
+            st.error("No news links found.")
+            return
 
-    if not links:
-        st.error("No news links found.")
-        st.stop()
+        st.subheader("Discovered News Links")
+        for l in links[:10]:
+            st.markdown(f"- {l}")
 
-    st.subheader("Discovered News Links")
-    for l in links[:10]:
-        st.markdown(f"- {l}")
+        # ---- ADAPTIVE CRAWLING ----
+        st.subheader("Crawled Articles")
+
+        candidates = rank_links(
+            [l for l in links if not is_blocked_domain(l)]
+        )
 
-    # ---- ADAPTIVE CRAWLING ----
-    st.subheader("Crawled Articles")
+        early = {}
 
-    successful_articles = []
-    attempted = 0
+        def report(attempted, text, articles):
+            if text:
+                st.success(f"Source {attempted}: extracted ✔")
+            else:
+                st.warning(f"Source {attempted}: blocked / failed ")
 
-    for link in links:
-        if len(successful_articles) >= 5:
-            break
+            # Groq only reads the first NEWS_CHAR_BUDGET chars, so once they are
+            # filled the remaining crawls can't change the prompt: start it now
+            if GROQ_API_KEY and not early and news_filled(articles):
+                early["stream"] = prefetch(analyze_with_groq(join_news(articles), price, ticker))
 
-        attempted += 1
-        with st.spinner(f"Trying source {attempted}..."):
-            text = crawl_article(link)
+        # One event loop, one pooled session: downloads overlap and the first
+        # 5 clean extractions win
+        with st.spinner(f"Crawling {len(candidates)} sources..."):
+            successful_articles = run_async(crawl_all(candidates, _extract_pool(), on_result=report))
 
-        if text:
-            successful_articles.append(text)
-            st.success(f"Source {attempted}: extracted ✔")
-        else:
-            st.warning(f"Source {attempted}: blocked / failed ")
+        if not successful_articles:
+            st.error("Could not extract content from any source.")
+            return
 
-        time.sleep(0.8)
+        combined_text = join_news(successful_articles)
 
-    if not successful_articles:
-        st.error("Could not extract content from any source.")
-        st.stop()
+        # ---- LLM ----
+        if not GROQ_API_KEY:
+            st.error("GROQ_API_KEY not set.")
+            return
 
-    combined_text = "\n\n".join(successful_articles)
+        st.subheader("AI Evaluation")
+        st.markdown("### AI Evaluation")
 
-    # ---- LLM ----
-    if not GROQ_API_KEY:
-        st.error("GROQ_API_KEY not set.")
-        st.stop()
+        # Tokens paint as they arrive instead of after the full completion
+        stream = early.get("stream") or analyze_with_groq(combined_text, price, ticker)
+        st.write_stream(stream)
 
-    st.subheader("AI Evaluation")
-    with st.spinner("Analyzing news vs price..."):
-        result = analyze_with_groq(combined_text, price, ticker)
 
-    st.markdown("### AI Evaluation")
-    st.markdown(result)
+analyzer()
 
 
 # ---------------- TOP STOCKS DASHBOARD ----------------
@@ -222,76 +820,143 @@ st.subheader("Market Snapshot: Top Stocks")
 
 TOP_STOCKS = ["AAPL", "MSFT", "GOOGL", "AMZN", "META", "NVDA", "TSLA", "NFLX", "AMD", "INTC"]
 
-@st.cache_data(ttl=900)
-def load_stock_history(tickers):
+HISTORY_CACHE_DIR = pathlib.Path(".yf_cache")
+
+def download_history(tickers, **kwargs):
+    # One batched request; yfinance fans the tickers out on its own threads
+    df = yf.download(
+        list(tickers),
+        group_by="ticker",
+        threads=True,
+        progress=False,
+        **kwargs
+    )
+
     data = {}
     for t in tickers:
-        hist = yf.Ticker(t).history(period="6mo")
+        if t not in df.columns.get_level_values(0):
+            continue
+        hist = df[t].dropna(how="all")
         if not hist.empty:
             data[t] = hist
     return data
 
-stock_data = load_stock_history(TOP_STOCKS)
+@st.cache_data(ttl=900)
+def load_stock_history(tickers):
+    # Six months of daily bars barely change between refreshes: keep them
+    # on disk and only ask Yahoo for the bars since each ticker's last row
+    cached = {}
+    for t in tickers:
+        path = HISTORY_CACHE_DIR / f"{t}.parquet"
+        try:
+            cached[t] = pd.read_parquet(path)
+        except Exception:
+            pass
+
+    missing = [t for t in tickers if t not in cached]
+    data = download_history(missing, period="6mo") if missing else {}
+
+    if cached:
+        since = min(hist.index[-1] for hist in cached.values())
+        delta = download_history(list(cached), start=since.strftime("%Y-%m-%d"))
+
+        rebased = []
+        for t, hist in cached.items():
+            if t in delta:
+                # Bars come back split- and dividend-adjusted, so a corporate
+                # action rescales all of them. If the bars both copies hold
+                # disagree, the cached history is on the old basis
+                overlap = hist.index.intersection(delta[t].index)
+                if not np.allclose(
+                    hist.loc[overlap, "Open"],
+                    delta[t].loc[overlap, "Open"],
+                    rtol=1e-4,
+                    equal_nan=True
+                ):
+                    rebased.append(t)
+                    continue
+                hist = pd.concat([hist, delta[t]])
+                # The latest bar can be re-fetched with updated values
+                hist = hist[~hist.index.duplicated(keep="last")].sort_index()
+            data[t] = hist[hist.index >= hist.index[-1] - pd.DateOffset(months=6)]
+
+        if rebased:
+            data.update(download_history(rebased, period="6mo"))
+
+    try:
+        HISTORY_CACHE_DIR.mkdir(exist_ok=True)
+        for t, hist in data.items():
+            hist.to_parquet(HISTORY_CACHE_DIR / f"{t}.parquet")
+    except Exception:
+        pass  # cache is best-effort; a read-only disk just means full fetches
+
+    return {t: data[t] for t in tickers if t in data}
+
+def close_metrics(close_mat):
+    # Latest close and 7-day % change for every ticker column in one pass
+    # over the 2-D array; only the two rows involved are read
+    last = close_mat[-1]
+    if len(close_mat) < 7:
+        return last, np.full_like(last, np.nan)
+    return last, (last / close_mat[-7] - 1.0) * 100.0
+
+@st.cache_data(ttl=900)
+def market_frames(tickers):
+    # Wide date x ticker frames: every chart below is a column slice of these
+    # or one vectorised reduction, instead of a dict rebuilt per chart. Cached
+    # so reruns unpickle three frames rather than every ticker's OHLCV history
+    stock_data = load_stock_history(tickers)
+    closes = pd.concat({k: v["Close"] for k, v in stock_data.items()}, axis=1)
+    volumes = pd.concat({k: v["Volume"] for k, v in stock_data.items()}, axis=1)
+    ranges = pd.concat({k: v["High"] - v["Low"] for k, v in stock_data.items()}, axis=1)
+    return closes, volumes, ranges
+
+closes, volumes, ranges = market_frames(TOP_STOCKS)
+latest, week_pct = close_metrics(closes.ffill().to_numpy())
 
 c1, c2 = st.columns(2)
 
 # Line chart – Price trends
 with c1:
     st.markdown("**1. Price Trends (6 months)**")
-    st.line_chart({k: v["Close"] for k, v in stock_data.items()})
+    st.line_chart(closes)
 
 # Area chart – Volume
 with c2:
     st.markdown("**2. Trading Volume (6 months)**")
-    st.area_chart({k: v["Volume"] for k, v in stock_data.items()})
+    st.area_chart(volumes)
 
 # Bar chart – Latest Close
 st.markdown("**3. Latest Closing Prices**")
-latest_prices = {
-    k: float(v["Close"].iloc[-1]) for k, v in stock_data.items()
-}
+latest_prices = pd.Series(latest, index=closes.columns, name="Close")
 st.bar_chart(latest_prices)
 
 # Bar chart – % Change (7d)
 st.markdown("**4. 7-Day % Change**")
-pct_change = {
-    k: round(((v["Close"].iloc[-1] / v["Close"].iloc[-7]) - 1) * 100, 2)
-    for k, v in stock_data.items() if len(v) >= 7
-}
+pct_change = pd.Series(week_pct, index=closes.columns, name="% Change").round(2).dropna()
 st.bar_chart(pct_change)
 
 # Line chart – AAPL vs MSFT
 st.markdown("**5. AAPL vs MSFT Price Comparison**")
-compare_df = {
-    "AAPL": stock_data["AAPL"]["Close"],
-    "MSFT": stock_data["MSFT"]["Close"]
-}
-st.line_chart(compare_df)
+st.line_chart(closes[["AAPL", "MSFT"]])
 
 # Area chart – NVDA momentum
 st.markdown("**6. NVDA Momentum (Close Price)**")
-st.area_chart(stock_data["NVDA"]["Close"])
+st.area_chart(closes["NVDA"])
 
 # Line chart – TSLA volatility
 st.markdown("**7. TSLA Volatility**")
-st.line_chart(stock_data["TSLA"]["High"] - stock_data["TSLA"]["Low"])
+st.line_chart(ranges["TSLA"])
 
 # Bar chart – Average Volume
 st.markdown("**8. Average Daily Volume**")
-avg_volume = {
-    k: int(v["Volume"].mean()) for k, v in stock_data.items()
-}
+avg_volume = volumes.mean().astype(int)
 st.bar_chart(avg_volume)
 
 # Line chart – META growth
 st.markdown("**9. META Growth Curve**")
-st.line_chart(stock_data["META"]["Close"])
+st.line_chart(closes["META"])
 
 # Line chart – Semiconductor stocks
 st.markdown("**10. Semiconductor Performance (AMD vs INTC)**")
-semi_df = {
-    "AMD": stock_data["AMD"]["Close"],
-    "INTC": stock_data["INTC"]["Close"]
-}
-
-st.line_chart(semi_df)
+st.line_chart(closes[["AMD", "INTC"]])